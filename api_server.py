@@ -1,8 +1,12 @@
 import asyncio
 import json
 import logging
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from quart import Quart, Response, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
+import orjson
+import hypercorn.asyncio
+import hypercorn.config
 import os
 import sys
 
@@ -12,21 +16,27 @@ script_dir = os.path.dirname(__file__)
 sys.path.insert(0, script_dir)
 
 from desktop_agent import DesktopAgent
+from logging_config import configure_logging
 
-# Configure logging for the Flask app itself
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('api_server.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging for the Quart app itself
+configure_logging('api_server.log')
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, used by jsonify and request.get_json"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+# Quart keeps the Flask API but runs natively on ASGI, so every request is
+# served from one event loop and many commands can await Ollama concurrently
+app = Quart(__name__)
+app.json = ORJSONProvider(app)
 # Enable CORS for all routes, allowing communication from your web UI
-CORS(app) 
+app = cors(app, allow_origin="*")
 
 # Initialize the DesktopAgent globally or when the app starts
 # IMPORTANT: Replace "/Users/shakib/Desktop/TFolder" with the actual path
@@ -34,16 +44,34 @@ CORS(app)
 # It's crucial for the agent to have correct permissions to this directory.
 DESKTOP_PATH = "/Users/shakib/Desktop/TestFolder" # <<< Verify this path!
 
-# Agent is initialized here, when the script starts
+# Agent is initialized once the server's event loop is running
 agent = None
 
+@app.before_serving
+async def init_agent():
+    global agent
+    try:
+        agent = DesktopAgent(DESKTOP_PATH)
+        logger.info(f"Desktop Agent initialized successfully for path: {DESKTOP_PATH}")
+        # Let Ollama cache the system prompt before the first command arrives
+        await agent.warm_up()
+    except Exception as e:
+        logger.error(f"Failed to initialize Desktop Agent: {e}")
+        # The app will still run, but the /command endpoint will return an error
+        # if the agent failed to initialize.
+
+@app.after_serving
+async def close_agent():
+    if agent is not None:
+        await agent.close()
+
 @app.route('/command', methods=['POST'])
 async def handle_command():
     global agent # Declare agent as global to ensure it's accessible and modified if needed
     if agent is None:
         return jsonify({"error": "Desktop Agent not initialized."}), 500
 
-    data = request.json
+    data = await request.get_json()
     user_command = data.get('command')
 
     if not user_command:
@@ -52,31 +80,48 @@ async def handle_command():
     logger.info(f"Received command from UI: {user_command}")
     
     try:
-        # Use asyncio.run to execute the async agent method
-        response = await agent.process_user_input(user_command)
+        # Commands are coalesced with others arriving at the same time
+        response = await agent.enqueue(user_command)
         logger.info(f"Agent response: {response}")
         return jsonify({"response": response})
     except Exception as e:
         logger.error(f"Error processing command: {e}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+@app.route('/command/stream', methods=['POST'])
+async def handle_command_stream():
+    if agent is None:
+        return jsonify({"error": "Desktop Agent not initialized."}), 500
+
+    data = await request.get_json()
+    user_command = data.get('command')
+
+    if not user_command:
+        return jsonify({"error": "No command provided."}), 400
+
+    logger.info(f"Received streaming command from UI: {user_command}")
+
+    async def events():
+        # Server-sent events: one JSON-encoded chunk per event, then a final done event
+        try:
+            async for chunk in agent.process_user_input_stream(user_command):
+                yield b"data: " + orjson.dumps({"chunk": chunk}) + b"\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming command: {e}")
+            yield b"event: error\ndata: " + orjson.dumps({"error": f"An error occurred: {str(e)}"}) + b"\n\n"
+        yield b"event: done\ndata: {}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.route('/')
 def index():
-    return "Desktop Agent API is running. Send POST requests to /command."
+    return "Desktop Agent API is running. Send POST requests to /command or /command/stream."
 
 if __name__ == '__main__':
-    # Initialize the agent here, before running the Flask app
-    try:
-        agent = DesktopAgent(DESKTOP_PATH)
-        logger.info(f"Desktop Agent initialized successfully for path: {DESKTOP_PATH}")
-    except Exception as e:
-        logger.error(f"Failed to initialize Desktop Agent: {e}")
-        # The app will still run, but the /command endpoint will return an error
-        # if the agent failed to initialize.
-
-    # Flask's debug mode for development: enables reloader and debugger
-    # For production, use a production-ready WSGI/ASGI server like Gunicorn/Uvicorn
-    # and disable debug.
-    logger.info("Starting Flask API server...")
+    # Serve with Hypercorn (ASGI) instead of the development server
+    config = hypercorn.config.Config()
     # Changed the port from 5000 to 5001 to resolve "Address already in use" error
-    app.run(debug=True, port=5001, host='0.0.0.0')
+    config.bind = ["0.0.0.0:5001"]
+    config.workers = 1
+    logger.info("Starting Quart API server with Hypercorn...")
+    asyncio.run(hypercorn.asyncio.serve(app, config))
@@ -1,27 +1,129 @@
 import asyncio
+import hashlib
 import json
 import logging
+import os
 import re
-from typing import Dict, Any, List
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, AsyncIterator, List, Optional
+import orjson
 from filesystem_server import MCPFilesystemServer
-from ollama_client import OllamaClient
+from logging_config import configure_logging
+from ollama_client import OllamaClient, parse_tool_call
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('desktop_agent.log'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging('desktop_agent.log')
 logger = logging.getLogger(__name__)
 
+# Conversation history keeps the last 16 user/assistant pairs; older user
+# requests are folded into a short summary message
+HISTORY_MAX_MESSAGES = 32
+HISTORY_SUMMARY_REQUESTS = 8
+
+# Response cache limits: cached completions are only reused while the
+# conversation is short, since longer histories make replies context-sensitive
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_MAX_HISTORY = 8
+
+# Commands queued within one window are sent to Ollama together
+BATCH_WINDOW_SECONDS = 0.02
+BATCH_MAX_SIZE = 8
+
+# Directory listings used by the bulk helpers are reused for this long,
+# as long as the directory's mtime is unchanged
+LISTING_CACHE_TTL_SECONDS = 2.0
+
+# Tools that change the directory tree and so invalidate cached listings
+_MUTATING_TOOLS = frozenset({"write_file", "create_directory", "delete_file", "move_file"})
+
+# Patterns used on every request, compiled once
+# Look for patterns like "list files in X folder" or "list X folder"
+_FOLDER_PATTERNS = [
+    re.compile(r'list.*?in\s+(\w+)\s+folder'),
+    re.compile(r'list.*?(\w+)\s+folder'),
+    re.compile(r'in\s+(\w+)\s+folder'),
+    re.compile(r'folder\s+(\w+)'),
+    re.compile(r'(\w+)\s+folder'),
+]
+# Handles arguments like 'filename.py', 'print("Hello")' and multi-line content:
+# the first argument (path) optionally quoted, then a comma, then the rest as the
+# second argument (content), optionally quoted. re.DOTALL makes . match newlines.
+_WRITE_FILE_ARGS = re.compile(r'^\s*([\'"]?)(.*?)\1\s*,\s*([\'"]?)(.*)\3\s*$', re.DOTALL)
+_MOVE_TO_FOLDER = re.compile(r'to\s+(\w+)')
+
+# Keywords that route a command to a special handler, mapped to dispatch tags
+_DISPATCH_KEYWORDS = (
+    ("move", "move"),
+    ("delete", "delete"),
+    ("image", "image"),
+    ("delete all files", "del_all"),
+    ("clear all files", "del_all"),
+    ("list", "list"),
+    ("folder", "folder"),
+    ("in", "in"),
+)
+
+# Opening of a plain {"response": "..."} reply, whose text can be streamed as it arrives
+_REPLY_PREFIX = re.compile(r'\s*\{\s*"response"\s*:\s*"')
+
+class _ReplyStreamer:
+    """Incrementally decode the text of a streamed {"response": "..."} reply"""
+    
+    def __init__(self):
+        self._buffer = ""
+        self._start = None  # Offset of the undecoded part of the string body
+        self._closed = False
+        self.emitted = ""
+    
+    def feed(self, token: str) -> str:
+        """Add a model token and return any newly decoded reply text"""
+        self._buffer += token
+        if self._closed:
+            return ""
+        if self._start is None:
+            match = _REPLY_PREFIX.match(self._buffer)
+            if not match:
+                return ""
+            self._start = match.end()
+        
+        # Decode up to the closing quote, holding back an incomplete escape
+        body = self._buffer
+        i = self._start
+        safe = len(body)
+        while i < len(body):
+            char = body[i]
+            if char == "\\":
+                width = 6 if body[i + 1:i + 2] == "u" else 2
+                # Keep both halves of a \uXXXX surrogate pair together
+                if width == 6 and body[i + 2:i + 4].lower() in ("d8", "d9", "da", "db"):
+                    width = 12
+                if i + width > len(body):
+                    safe = i
+                    break
+                i += width
+                continue
+            if char == '"':
+                safe = i
+                self._closed = True
+                break
+            i += 1
+        
+        text = json.loads('"' + body[self._start:safe] + '"', strict=False)
+        self._start = safe
+        self.emitted += text
+        return text
+
 class DesktopAgent:
+    IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
+    VIDEO_EXTS = ('.mp4', '.avi', '.mov', '.mkv')
+    
     def __init__(self, desktop_path: str = "/Users/shakib/Desktop/TestFolder"):
         self.filesystem = MCPFilesystemServer(desktop_path)
         self.ollama = OllamaClient(model="llama3.2")
-        self.conversation_history = []
+        self.conversation_history = deque(maxlen=HISTORY_MAX_MESSAGES)
+        self._evicted_requests = deque(maxlen=HISTORY_SUMMARY_REQUESTS)
+        self._summary = ""
         self.desktop_path = desktop_path
         
         # Define available tools
@@ -29,40 +131,73 @@ class DesktopAgent:
             {
                 "name": "list_directory",
                 "description": "List contents of a directory. Usage: list_directory(path)",
+                "parameters": ["path"],
                 "function": self.filesystem.list_directory
             },
             {
                 "name": "read_file",
                 "description": "Read contents of a file. Usage: read_file(path)",
+                "parameters": ["path"],
                 "function": self.filesystem.read_file
             },
             {
                 "name": "write_file",
                 "description": "Write content to a file. Usage: write_file(path, content)",
+                "parameters": ["path", "content"],
                 "function": self.filesystem.write_file
             },
             {
                 "name": "create_directory",
                 "description": "Create a directory. Usage: create_directory(path)",
+                "parameters": ["path"],
                 "function": self.filesystem.create_directory
             },
             {
                 "name": "delete_file",
                 "description": "Delete a file or directory. Usage: delete_file(path)",
+                "parameters": ["path"],
                 "function": self.filesystem.delete_file
             },
             {
                 "name": "move_file",
                 "description": "Move/rename a file or directory. Usage: move_file(source, destination)",
+                "parameters": ["source", "destination"],
                 "function": self.filesystem.move_file
             },
             {
                 "name": "get_file_info",
                 "description": "Get information about a file or directory. Usage: get_file_info(path)",
+                "parameters": ["path"],
                 "function": self.filesystem.get_file_info
             }
         ]
         
+        # Tool lookups used on every tool call
+        self._tool_by_name = {t["name"]: t for t in self.tools}
+        self._valid_tool_names = frozenset(self._tool_by_name)
+        self._valid_tools_str = ", ".join(self._tool_by_name)
+        
+        # Static system prompt, built once so every request shares the same prefix
+        self._tools_system_prompt = self.ollama.build_system_prompt(self.tools)
+        
+        # (path, stat) -> (expiry, directory mtime_ns, list_directory result)
+        self._ls_cache: Dict[str, tuple] = {}
+        
+        # Commands waiting for the micro-batching loop
+        self._pending = []
+        self._batch_task = None
+        
+        # Batches and streamed commands each run their history updates under this
+        # lock, so turns are recorded one at a time in arrival order
+        self._history_lock = asyncio.Lock()
+        
+        # Cache of raw Ollama completions keyed on (normalized input, tool list)
+        self._exact_cache = OrderedDict()
+        self._tools_key = hashlib.blake2b(
+            "\n".join(f"{t['name']}:{t['description']}" for t in self.tools).encode(),
+            digest_size=16
+        ).digest()
+        
         logger.info(f"Initialized Desktop Agent with {len(self.tools)} tools")
     
     async def process_user_input(self, user_input: str) -> str:
@@ -70,110 +205,308 @@ class DesktopAgent:
         try:
             logger.info(f"Processing user input: {user_input[:100]}...")
             
-            # Check for special commands that need multiple operations
-            if "move" in user_input.lower() and "image" in user_input.lower():
-                folder_match = re.search(r'to\s+(\w+)', user_input.lower())
-                if folder_match:
-                    folder_name = folder_match.group(1)
-                    return await self.move_images_to_folder(folder_name)
-            
-            if "delete" in user_input.lower() and "image" in user_input.lower():
-                return await self.delete_images()
-
-            if "delete all files" in user_input.lower() or "clear all files" in user_input.lower():
-                return await self.delete_all_files_in_current_folder()
+            fast_response = await self.run_special_command(user_input)
+            if fast_response is not None:
+                return fast_response
             
-            # Check for listing files in specific folder
-            if "list" in user_input.lower() and ("in" in user_input.lower() or "folder" in user_input.lower()):
-                folder_name = self.extract_folder_name(user_input)
-                if folder_name:
-                    return await self.list_folder_contents(folder_name)
+            cache_key = self._cache_key(user_input)
             
             # Add user message to conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_input
-            })
-            
-            # Generate response from Ollama
-            response = await self.ollama.generate_response(
-                self.conversation_history,
-                self.tools
-            )
-            
-            logger.debug(f"Ollama response: {response}")
-            
-            # Check if the response contains a tool call with better regex
-            tool_call_patterns = [
-                r'TOOL_CALL:\s*(\w+)\s*\((.*?)\)',
-                r'USE_TOOL:\s*(\w+)\s*\((.*?)\)',
-            ]
-            
-            tool_call_match = None
-            for pattern in tool_call_patterns:
-                tool_call_match = re.search(pattern, response, re.DOTALL) # Added re.DOTALL for multi-line content
-                if tool_call_match:
-                    break
+            self._append_history("user", user_input)
+            
+            # Generate response from Ollama, reusing a cached completion if possible
+            response = self._get_cached_response(cache_key)
+            if response is None:
+                response = await self.ollama.generate_response(
+                    self._history_messages(),
+                    self.tools,
+                    system=self._tools_system_prompt
+                )
+                self._store_cached_response(cache_key, response)
+            else:
+                logger.info("Response cache hit")
             
-            if tool_call_match:
-                tool_name = tool_call_match.group(1)
-                tool_args = tool_call_match.group(2).strip()
-                
-                # Validate tool name
-                valid_tools = [t["name"] for t in self.tools]
-                if tool_name not in valid_tools:
-                    # Try to find a close match
-                    if "list" in tool_name.lower():
-                        tool_name = "list_directory"
-                        tool_args = "." if not tool_args else tool_args
-                    else:
-                        return f"❌ Unknown tool: {tool_name}. Available tools: {', '.join(valid_tools)}"
+            return await self.handle_model_response(user_input, response)
                 
-                logger.info(f"Tool call detected: {tool_name}({tool_args})")
+        except Exception as e:
+            return self._record_error(e)
+    
+    async def process_user_input_stream(self, user_input: str) -> AsyncIterator[str]:
+        """Process user input, yielding the response in chunks as it is generated"""
+        async with self._history_lock:
+            try:
+                logger.info(f"Processing user input: {user_input[:100]}...")
                 
-                # Execute the tool
-                tool_result = await self.execute_tool(tool_name, tool_args)
+                fast_response = await self.run_special_command(user_input)
+                if fast_response is not None:
+                    yield fast_response
+                    return
                 
-                # Generate final response based on tool result
-                final_response = await self.generate_final_response(tool_name, tool_result, user_input)
+                cache_key = self._cache_key(user_input)
+                self._append_history("user", user_input)
                 
-                # Add assistant response to conversation history
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": final_response
-                })
+                streamer = _ReplyStreamer()
+                response = self._get_cached_response(cache_key)
+                if response is None:
+                    parts = []
+                    async for token in self.ollama.generate_stream(
+                        self._history_messages(),
+                        self.tools,
+                        system=self._tools_system_prompt
+                    ):
+                        parts.append(token)
+                        # Plain replies are forwarded as they arrive; tool calls wait for the full output
+                        text = streamer.feed(token)
+                        if text:
+                            yield text
+                    response = "".join(parts).strip()
+                    self._store_cached_response(cache_key, response)
+                else:
+                    logger.info("Response cache hit")
                 
-                return final_response
+                final_response = await self.handle_model_response(user_input, response)
+                if final_response.startswith(streamer.emitted):
+                    remainder = final_response[len(streamer.emitted):]
+                else:
+                    remainder = "\n" + final_response
+                if remainder:
+                    yield remainder
+                    
+            except (asyncio.CancelledError, GeneratorExit):
+                # The client went away before a reply was recorded; don't leave
+                # its request dangling in the history
+                last = self.conversation_history[-1] if self.conversation_history else None
+                if last == {"role": "user", "content": user_input}:
+                    self.conversation_history.pop()
+                raise
+            except Exception as e:
+                yield self._record_error(e)
+    
+    async def run_special_command(self, user_input: str) -> Optional[str]:
+        """Handle commands that are answered without the LLM; returns None otherwise"""
+        ui_lower = user_input.lower()
+        # Classify the input once, then dispatch on the matched tags
+        tags = {tag for keyword, tag in _DISPATCH_KEYWORDS if keyword in ui_lower}
+        
+        # Check for special commands that need multiple operations
+        if "move" in tags and "image" in tags:
+            folder_match = _MOVE_TO_FOLDER.search(ui_lower)
+            if folder_match:
+                folder_name = folder_match.group(1)
+                return await self.move_images_to_folder(folder_name)
+        
+        if "delete" in tags and "image" in tags:
+            return await self.delete_images()
+
+        if "del_all" in tags:
+            return await self.delete_all_files_in_current_folder()
+        
+        # Check for listing files in specific folder
+        if "list" in tags and ("in" in tags or "folder" in tags):
+            folder_name = self.extract_folder_name(user_input)
+            if folder_name:
+                return await self.list_folder_contents(folder_name)
+        
+        return None
+    
+    async def handle_model_response(self, user_input: str, response: str) -> str:
+        """Run any tool call in the model's response and record the final answer"""
+        logger.debug("Ollama response: %s", response)
+        
+        tool_name, tool_args, reply = self.parse_model_response(response)
+        
+        if tool_name:
+            # Validate tool name
+            if tool_name not in self._valid_tool_names:
+                # Try to find a close match
+                if "list" in tool_name.lower():
+                    tool_name = "list_directory"
+                    tool_args = tool_args or "."
+                else:
+                    return f"❌ Unknown tool: {tool_name}. Available tools: {self._valid_tools_str}"
+            
+            logger.info(f"Tool call detected: {tool_name}({tool_args})")
+            
+            # Execute the tool
+            tool_result = await self.execute_tool(
+                tool_name, tool_args, need_size=self._listing_mode(user_input) != "folders"
+            )
+            
+            # Generate final response based on tool result
+            final_response = await self.generate_final_response(tool_name, tool_result, user_input)
+            
+            # Add assistant response to conversation history
+            self._append_history("assistant", final_response)
+            
+            return final_response
+        else:
+            # No tool call, just return the response
+            self._append_history("assistant", reply)
+            # The decoded reply stands for the raw one, so Ollama's context stays usable
+            self.ollama.record_reply(response, reply)
+            return reply
+    
+    def parse_model_response(self, response: str) -> tuple:
+        """Split model output into (tool_name, tool_args, reply)"""
+        # Replies are JSON: {"tool": ..., "args": {...}} or {"response": ...}
+        parsed = self._loads_tolerant(response)
+        if isinstance(parsed, dict):
+            if parsed.get("tool"):
+                args = parsed.get("args")
+                if isinstance(args, str):
+                    # A bare string is the tool's single positional argument
+                    args = [args]
+                elif not isinstance(args, (dict, list)):
+                    args = {}
+                return str(parsed["tool"]), args, None
+            if "response" in parsed:
+                return None, None, str(parsed["response"])
+        
+        # Fall back to the TOOL_CALL:name(args) text format for models that ignore JSON mode
+        tool_call = parse_tool_call(response)
+        if tool_call:
+            return tool_call[0], tool_call[1], None
+        
+        return None, None, response
+    
+    def _loads_tolerant(self, text: str):
+        """Parse a JSON reply, retrying once without text around the outermost braces"""
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            start, end = text.find("{"), text.rfind("}")
+            if start == -1 or end <= start:
+                return None
+            try:
+                return orjson.loads(text[start:end + 1])
+            except orjson.JSONDecodeError:
+                return None
+    
+    def _record_error(self, error: Exception) -> str:
+        """Log a processing error and record it as the assistant's reply"""
+        logger.error(f"Error processing user input: {error}")
+        error_msg = f"Sorry, I encountered an error: {str(error)}"
+        self._append_history("assistant", error_msg)
+        return error_msg
+    
+    def enqueue(self, user_input: str) -> asyncio.Future:
+        """Queue a command for micro-batched processing; resolves to the response"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_input, future))
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = loop.create_task(self._batch_loop())
+        return future
+    
+    async def _batch_loop(self):
+        """Drain queued commands, coalescing those that arrive within one window"""
+        while self._pending:
+            await asyncio.sleep(BATCH_WINDOW_SECONDS)
+            batch = self._pending[:BATCH_MAX_SIZE]
+            del self._pending[:BATCH_MAX_SIZE]
+            async with self._history_lock:
+                await self._process_batch(batch)
+    
+    async def _process_batch(self, batch: List[tuple]):
+        """Answer a batch of commands with one concurrent round of Ollama calls"""
+        llm_batch = []
+        for user_input, future in batch:
+            try:
+                logger.info(f"Processing user input: {user_input[:100]}...")
+                # Special commands don't call the LLM, so they skip batching
+                fast_response = await self.run_special_command(user_input)
+            except Exception as e:
+                fast_response = self._record_error(e)
+            if fast_response is not None:
+                if not future.done():
+                    future.set_result(fast_response)
             else:
-                # No tool call, just return the response
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": response
-                })
-                return response
-                
-        except Exception as e:
-            logger.error(f"Error processing user input: {e}")
-            error_msg = f"Sorry, I encountered an error: {str(e)}"
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": error_msg
-            })
-            return error_msg
+                llm_batch.append((user_input, future))
+        
+        if not llm_batch:
+            return
+        
+        # Every prompt in the batch is generated against the same history
+        history = self._history_messages()
+        # Each prompt is that history plus its own, not yet recorded, user message
+        history_len = len(self.conversation_history) + 1
+        cache_keys = [self._cache_key(user_input, history) for user_input, _ in llm_batch]
+        responses = [self._get_cached_response(key, history_len) for key in cache_keys]
+        misses = [i for i, response in enumerate(responses) if response is None]
+        if misses:
+            generated = await self.ollama.generate_batch(
+                [history + [{"role": "user", "content": llm_batch[i][0]}] for i in misses],
+                self.tools,
+                system=self._tools_system_prompt
+            )
+            for i, response in zip(misses, generated):
+                responses[i] = response
+                self._store_cached_response(cache_keys[i], response, history_len)
+        
+        # Tool calls run in arrival order so history stays consistent
+        for (user_input, future), response in zip(llm_batch, responses):
+            try:
+                self._append_history("user", user_input)
+                result = await self.handle_model_response(user_input, response)
+            except Exception as e:
+                result = self._record_error(e)
+            if not future.done():
+                future.set_result(result)
+    
+    async def warm_up(self) -> bool:
+        """Prime Ollama with the static system prompt"""
+        return await self.ollama.warm_up(self._tools_system_prompt)
+    
+    async def close(self):
+        """Stop the batching loop and release the Ollama HTTP client"""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+        await self.ollama.aclose()
+    
+    def _cache_key(self, user_input: str, history: Optional[List[Dict[str, str]]] = None) -> bytes:
+        """Build the response cache key for a user input and the history before it"""
+        # The completion depends on the prior turns too ("delete it"), so they are
+        # part of the key; call this before the user message is recorded
+        if history is None:
+            history = self._history_messages()
+        hasher = hashlib.blake2b(self._tools_key, digest_size=16)
+        hasher.update(orjson.dumps(history))
+        hasher.update(b"\0")
+        hasher.update(user_input.strip().lower().encode())
+        return hasher.digest()
+    
+    def _get_cached_response(self, key: bytes, history_len: Optional[int] = None):
+        """Return a cached Ollama completion, or None on a miss"""
+        # history_len counts the messages the prompt is built from, including the
+        # current user message; by default that message is already in the history
+        if history_len is None:
+            history_len = len(self.conversation_history)
+        if history_len > RESPONSE_CACHE_MAX_HISTORY:
+            return None
+        response = self._exact_cache.get(key)
+        if response is not None:
+            self._exact_cache.move_to_end(key)
+        return response
+    
+    def _store_cached_response(self, key: bytes, response: str, history_len: Optional[int] = None):
+        """Store an Ollama completion in the LRU response cache"""
+        if history_len is None:
+            history_len = len(self.conversation_history)
+        if history_len > RESPONSE_CACHE_MAX_HISTORY:
+            return
+        # Don't cache empty completions or transport failures reported by the client
+        if not response or response.startswith("Error communicating with Ollama"):
+            return
+        self._exact_cache[key] = response
+        self._exact_cache.move_to_end(key)
+        if len(self._exact_cache) > RESPONSE_CACHE_SIZE:
+            self._exact_cache.popitem(last=False)
     
     def extract_folder_name(self, user_input: str) -> str:
         """Extract folder name from user input"""
-        # Look for patterns like "list files in X folder" or "list X folder"
-        patterns = [
-            r'list.*?in\s+(\w+)\s+folder',
-            r'list.*?(\w+)\s+folder',
-            r'in\s+(\w+)\s+folder',
-            r'folder\s+(\w+)',
-            r'(\w+)\s+folder'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, user_input.lower())
+        ui_lower = user_input.lower()
+        for pattern in _FOLDER_PATTERNS:
+            match = pattern.search(ui_lower)
             if match:
                 return match.group(1)
         
@@ -183,14 +516,15 @@ class DesktopAgent:
         """List contents of a specific folder"""
         try:
             # First, get all folders to find the exact match
-            list_result = await self.filesystem.list_directory(".")
+            list_result = await self._cached_list(".", stat=False)
             if "error" in list_result:
                 return f"❌ Error listing desktop: {list_result['error']}"
             
             # Find matching folder (case-insensitive)
             matching_folder = None
+            folder_prefix = folder_name.lower()
             for item in list_result.get("items", []):
-                if item["type"] == "directory" and item["name"].lower().startswith(folder_name.lower()):
+                if item["type"] == "directory" and item["name"].lower().startswith(folder_prefix):
                     matching_folder = item["name"]
                     break
             
@@ -198,7 +532,7 @@ class DesktopAgent:
                 return f"❌ No folder found starting with '{folder_name}'"
             
             # List contents of the found folder
-            folder_result = await self.filesystem.list_directory(matching_folder)
+            folder_result = await self._cached_list(matching_folder)
             if "error" in folder_result:
                 return f"❌ Error listing folder '{matching_folder}': {folder_result['error']}"
             
@@ -206,54 +540,45 @@ class DesktopAgent:
             if not items:
                 return f"📁 Folder '{matching_folder}' is empty"
             
-            response = f"📁 Contents of '{matching_folder}' ({len(items)} items):\\n\\n"
+            lines = [f"📁 Contents of '{matching_folder}' ({len(items)} items):", ""]
             
-            folders = [item for item in items if item["type"] == "directory"]
-            files = [item for item in items if item["type"] == "file"]
+            folders, files, _, _ = self._categorize_items(items)
             
             if folders:
-                response += f"📁 Folders ({len(folders)}):\\n"
-                for folder in folders:
-                    response += f"  📁 {folder['name']}\\n"
+                lines.append(f"📁 Folders ({len(folders)}):")
+                lines.extend(f"  📁 {folder['name']}" for folder in folders)
             
             if files:
-                response += f"\\n📄 Files ({len(files)}):\\n"
-                for file in files:
-                    size_kb = file.get("size", 0) / 1024 if file.get("size") else 0
-                    response += f"  📄 {file['name']} ({size_kb:.1f} KB)\\n"
+                lines.append("")
+                lines.append(f"📄 Files ({len(files)}):")
+                lines.extend(
+                    f"  📄 {file['name']} ({(file.get('size') or 0) / 1024:.1f} KB)" for file in files
+                )
             
-            return response
+            return "\n".join(lines)
             
         except Exception as e:
             logger.error(f"Error listing folder {folder_name}: {e}")
             return f"❌ Error listing folder: {str(e)}"
     
-    async def execute_tool(self, tool_name: str, tool_args: str) -> Dict[str, Any]:
+    async def execute_tool(self, tool_name: str, tool_args, need_size: bool = True) -> Dict[str, Any]:
         """Execute a tool with given arguments"""
         try:
-            logger.debug(f"Executing tool: {tool_name} with args: {tool_args}")
+            logger.debug("Executing tool: %s with args: %s", tool_name, tool_args)
             
             # Find the tool
-            tool = None
-            for t in self.tools:
-                if t["name"] == tool_name:
-                    tool = t
-                    break
-            
+            tool = self._tool_by_name.get(tool_name)
             if not tool:
                 return {"error": f"Tool '{tool_name}' not found"}
             
+            if isinstance(tool_args, dict):
+                # JSON tool calls name their arguments; order them by the tool's parameters
+                args = [str(tool_args[name]) for name in tool["parameters"] if name in tool_args]
+            elif isinstance(tool_args, list):
+                args = [str(arg) for arg in tool_args]
             # Special handling for write_file to correctly parse path and content
-            if tool_name == "write_file":
-                # This regex handles arguments like 'filename.py', 'print("Hello")'
-                # and also 'filename.py', '''
-                # multiline
-                # content
-                # '''
-                # It looks for the first argument (path) optionally quoted, then a comma,
-                # then the rest as the second argument (content), optionally quoted.
-                # re.DOTALL makes . match newlines.
-                match = re.match(r'^\s*([\'"]?)(.*?)\1\s*,\s*([\'"]?)(.*)\3\s*$', tool_args, re.DOTALL)
+            elif tool_name == "write_file":
+                match = _WRITE_FILE_ARGS.match(tool_args)
                 if match:
                     path = match.group(2).strip()
                     content = match.group(4).strip()
@@ -264,15 +589,26 @@ class DesktopAgent:
                 # For other tools, use the existing simple comma-separated parsing
                 args = self.parse_tool_arguments(tool_args)
             
+            # Only list_directory has a default path; never guess one for the others
+            required = [] if tool_name == "list_directory" else tool["parameters"]
+            if len(args) < len(required) or (isinstance(tool_args, dict) and
+                                             any(name not in tool_args for name in required)):
+                expected = ", ".join(f"'{name}'" for name in tool["parameters"])
+                return {"error": f"Invalid arguments for {tool_name}: {tool_args}. Expected {expected}"}
+            
             # Execute the tool function
-            if tool_name == "write_file" and len(args) == 2:
+            if tool_name == "list_directory":
+                # Skip per-entry stat calls when the caller won't show sizes
+                result = await tool["function"](args[0] if args else ".", stat=need_size)
+            elif tool_name == "write_file" and len(args) == 2:
                 result = await tool["function"](args[0], args[1])
             elif tool_name == "move_file" and len(args) == 2:
                 result = await tool["function"](args[0], args[1])
-            elif len(args) >= 1:
+            else:
                 result = await tool["function"](args[0])
-            else: # Fallback for list_directory with no path specified
-                result = await tool["function"](".")
+            
+            if tool_name in _MUTATING_TOOLS and "error" not in result:
+                self._ls_cache.clear()
             
             logger.info(f"Tool {tool_name} executed successfully")
             return result
@@ -284,7 +620,8 @@ class DesktopAgent:
     def parse_tool_arguments(self, args_str: str) -> List[str]:
         """Parse tool arguments from string (for non-write_file tools)"""
         if not args_str.strip():
-            return ["."]
+            # No arguments; only list_directory may default its path
+            return []
         
         # Simple argument parsing - split by comma and strip quotes
         args = []
@@ -320,12 +657,40 @@ class DesktopAgent:
             elif tool_name == "get_file_info":
                 return self.format_file_info(tool_result)
             
-            return f"Tool {tool_name} completed: {json.dumps(tool_result, indent=2)}"
+            return f"Tool {tool_name} completed: {orjson.dumps(tool_result, option=orjson.OPT_INDENT_2).decode()}"
             
         except Exception as e:
             logger.error(f"Error generating final response: {e}")
             return f"Tool completed but error formatting response: {str(e)}"
     
+    def _categorize_items(self, items: List[Dict[str, Any]], want_images: bool = False,
+                          want_videos: bool = False) -> tuple:
+        """Split listing items into folders, files, images and videos in one pass"""
+        folders, files, images, videos = [], [], [], []
+        for item in items:
+            if item["type"] == "directory":
+                folders.append(item)
+            else:
+                files.append(item)
+                if want_images or want_videos:
+                    name_lower = item["name"].lower()
+                    if want_images and name_lower.endswith(self.IMAGE_EXTS):
+                        images.append(item)
+                    if want_videos and name_lower.endswith(self.VIDEO_EXTS):
+                        videos.append(item)
+        return folders, files, images, videos
+    
+    def _listing_mode(self, original_request: str) -> str:
+        """Which view of a directory listing the request asks for"""
+        req_lower = original_request.lower()
+        if any(ext in req_lower for ext in ('.mp4', 'video', 'movie')):
+            return "videos"
+        if any(ext in req_lower for ext in ('.jpg', '.png', '.jpeg', 'image', 'photo')):
+            return "images"
+        if 'folder' in req_lower or 'director' in req_lower:
+            return "folders"
+        return "all"
+    
     def format_directory_listing(self, tool_result: Dict[str, Any], original_request: str) -> str:
         """Format directory listing based on user request"""
         if "items" not in tool_result:
@@ -334,64 +699,68 @@ class DesktopAgent:
         items = tool_result["items"]
         path = tool_result.get("path", "Desktop")
         
+        mode = self._listing_mode(original_request)
+        if mode == "folders":
+            # Folder-only requests never need the file lists or their sizes
+            folders = [item for item in items if item["type"] == "directory"]
+        else:
+            folders, files, images, videos = self._categorize_items(
+                items, want_images=mode == "images", want_videos=mode == "videos"
+            )
+        
         # Filter based on request
-        if any(ext in original_request.lower() for ext in ['.mp4', 'video', 'movie']):
-            filtered_items = [item for item in items if item["name"].lower().endswith(('.mp4', '.avi', '.mov', '.mkv'))]
+        if mode == "videos":
+            filtered_items = videos
             if filtered_items:
-                response = f"🎬 Found {len(filtered_items)} video files:\\n"
-                for item in filtered_items:
-                    size_mb = item.get("size", 0) / (1024*1024) if item.get("size") else 0
-                    response += f"📹 {item['name']} ({size_mb:.1f} MB)\\n"
-                return response
+                lines = [f"🎬 Found {len(filtered_items)} video files:"]
+                lines.extend(
+                    f"📹 {item['name']} ({(item.get('size') or 0) / (1024*1024):.1f} MB)" for item in filtered_items
+                )
+                return "\n".join(lines)
             else:
                 return "❌ No video files found on Desktop"
         
-        elif any(ext in original_request.lower() for ext in ['.jpg', '.png', '.jpeg', 'image', 'photo']):
-            filtered_items = [item for item in items if item["name"].lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))]
+        elif mode == "images":
+            filtered_items = images
             if filtered_items:
-                response = f"🖼️ Found {len(filtered_items)} image files:\\n"
-                for item in filtered_items:
-                    size_kb = item.get("size", 0) / 1024 if item.get("size") else 0
-                    response += f"🖼️ {item['name']} ({size_kb:.1f} KB)\\n"
-                return response
+                lines = [f"🖼️ Found {len(filtered_items)} image files:"]
+                lines.extend(
+                    f"🖼️ {item['name']} ({(item.get('size') or 0) / 1024:.1f} KB)" for item in filtered_items
+                )
+                return "\n".join(lines)
             else:
                 return "❌ No image files found on Desktop"
         
-        elif 'folder' in original_request.lower() or 'director' in original_request.lower():
-            folders = [item for item in items if item["type"] == "directory"]
+        elif mode == "folders":
             if folders:
-                response = f"📁 Found {len(folders)} folders on Desktop:\\n"
-                for folder in folders[:20]:  # Limit to first 20
-                    response += f"📁 {folder['name']}\\n"
+                lines = [f"📁 Found {len(folders)} folders on Desktop:"]
+                lines.extend(f"📁 {folder['name']}" for folder in folders[:20])  # Limit to first 20
                 if len(folders) > 20:
-                    response += f"... and {len(folders) - 20} more folders"
-                return response
+                    lines.append(f"... and {len(folders) - 20} more folders")
+                return "\n".join(lines)
             else:
                 return "❌ No folders found on Desktop"
         
         else:
             # General listing
-            folders = [item for item in items if item["type"] == "directory"]
-            files = [item for item in items if item["type"] == "file"]
-            
-            response = f" 📂 Desktop contents ({len(items)} total items):\\n\\n"
+            lines = [f" 📂 Desktop contents ({len(items)} total items):", ""]
             
             if folders:
-                response += f"📁 Folders ({len(folders)}):\\n"
-                for folder in folders[:10]:
-                    response += f"  📁 {folder['name']}\\n"
+                lines.append(f"📁 Folders ({len(folders)}):")
+                lines.extend(f"  📁 {folder['name']}" for folder in folders[:10])
                 if len(folders) > 10:
-                    response += f"  ... and {len(folders) - 10} more folders\\n"
+                    lines.append(f"  ... and {len(folders) - 10} more folders")
             
             if files:
-                response += f"\\n📄 Files ({len(files)}):\\n"
-                for file in files[:10]:
-                    size_kb = file.get("size", 0) / 1024 if file.get("size") else 0
-                    response += f"  📄 {file['name']} ({size_kb:.1f} KB)\\n"
+                lines.append("")
+                lines.append(f"📄 Files ({len(files)}):")
+                lines.extend(
+                    f"  📄 {file['name']} ({(file.get('size') or 0) / 1024:.1f} KB)" for file in files[:10]
+                )
                 if len(files) > 10:
-                    response += f"  ... and {len(files) - 10} more files\\n"
+                    lines.append(f"  ... and {len(files) - 10} more files")
             
-            return response
+            return "\n".join(lines)
     
     def format_file_content(self, tool_result: Dict[str, Any]) -> str:
         """Format file content for display"""
@@ -404,52 +773,93 @@ class DesktopAgent:
                 return f"📄 {file_path} is a binary file ({tool_result.get('size', 0)} bytes)"
             else:
                 preview = content[:500] + "..." if len(content) > 500 else content
-                return f"📄 Content of {file_path} ({tool_result.get('size', 0)} bytes):\\n\\n{preview}"
+                return f"📄 Content of {file_path} ({tool_result.get('size', 0)} bytes):\n\n{preview}"
         else:
             return "❌ Could not read file content"
     
     def format_file_info(self, tool_result: Dict[str, Any]) -> str:
         """Format file information for display"""
         info = tool_result
-        return f"ℹ️ File info for {info.get('name', 'file')}:\\n" \
-               f"📍 Path: {info.get('path', 'unknown')}\\n" \
-               f"📁 Type: {info.get('type', 'unknown')}\\n" \
-               f"📏 Size: {info.get('size', 0)} bytes\\n" \
-               f"🔒 Permissions: {info.get('permissions', 'unknown')}"
+        return "\n".join([
+            f"ℹ️ File info for {info.get('name', 'file')}:",
+            f"📍 Path: {info.get('path', 'unknown')}",
+            f"📁 Type: {info.get('type', 'unknown')}",
+            f"📏 Size: {info.get('size', 0)} bytes",
+            f"🔒 Permissions: {info.get('permissions', 'unknown')}"
+        ])
+    
+    def _append_history(self, role: str, content: str):
+        """Append a message, summarizing the oldest message once the history is full"""
+        if len(self.conversation_history) == self.conversation_history.maxlen:
+            evicted = self.conversation_history[0]
+            if evicted["role"] == "user":
+                self._evicted_requests.append(evicted["content"][:100])
+                self._summary = "Earlier in this conversation the user asked: " + \
+                                "; ".join(self._evicted_requests)
+        self.conversation_history.append({"role": role, "content": content})
+    
+    def _history_messages(self) -> List[Dict[str, str]]:
+        """Conversation history as sent to Ollama, led by the summary of evicted turns"""
+        messages = list(self.conversation_history)
+        if self._summary:
+            messages.insert(0, {"role": "system", "content": self._summary})
+        return messages
     
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._evicted_requests.clear()
+        self._summary = ""
+        self.ollama.reset_context()
         logger.info("Conversation history cleared")
     
+    async def _cached_list(self, path: str, stat: bool = True) -> Dict[str, Any]:
+        """list_directory with a short-lived cache validated against the directory mtime"""
+        try:
+            mtime = os.stat(os.path.join(self.desktop_path, path)).st_mtime_ns
+        except OSError:
+            mtime = 0
+        now = time.monotonic()
+        key = (path, stat)
+        entry = self._ls_cache.get(key)
+        if entry and entry[0] > now and entry[1] == mtime:
+            return entry[2]
+        result = await self.filesystem.list_directory(path, stat=stat)
+        if "error" not in result:
+            self._ls_cache[key] = (now + LISTING_CACHE_TTL_SECONDS, mtime, result)
+        return result
+    
+    def _collect_errors(self, names: List[str], results: List) -> List[tuple]:
+        """Pair each failed bulk operation with its error message"""
+        return [(name, result["error"]) for name, result in zip(names, results) if "error" in result]
+    
     async def move_images_to_folder(self, folder_name: str) -> str:
         """Helper method to move all image files to a specific folder"""
         try:
             # First, list all files
-            list_result = await self.filesystem.list_directory(".")
+            list_result = await self._cached_list(".", stat=False)
             if "error" in list_result:
                 return f"❌ Error listing files: {list_result['error']}"
             
             # Find image files
-            image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp']
-            image_files = []
-            
-            for item in list_result.get("items", []):
-                if item["type"] == "file":
-                    name_lower = item["name"].lower()
-                    if any(name_lower.endswith(ext) for ext in image_extensions):
-                        image_files.append(item["name"])
+            image_files = [
+                item["name"] for item in list_result.get("items", [])
+                if item["type"] == "file" and item["name"].lower().endswith(self.IMAGE_EXTS)
+            ]
             
             if not image_files:
                 return "❌ No image files found to move."
             
-            # Move each image file to the specified folder
-            for image_file in image_files:
-                source_path = f"./{image_file}"
-                destination_path = f"./{folder_name}/{image_file}"
-                move_result = await self.filesystem.move_file(source_path, destination_path)
-                if "error" in move_result:
-                    return f"❌ Error moving {image_file}: {move_result['error']}"
+            # Move all image files to the specified folder in one batch
+            results = await self.filesystem.move_files([
+                (f"./{image_file}", f"./{folder_name}/{image_file}") for image_file in image_files
+            ])
+            self._ls_cache.clear()
+            errors = self._collect_errors(image_files, results)
+            if errors:
+                moved_count = len(image_files) - len(errors)
+                return f"❌ Moved {moved_count} image files to {folder_name}, but some failed: " + \
+                       "; ".join(f"{name}: {error}" for name, error in errors)
             
             return f"✅ Successfully moved {len(image_files)} image files to {folder_name}."
         
@@ -461,28 +871,27 @@ class DesktopAgent:
         """Helper method to delete all image files"""
         try:
             # First, list all files
-            list_result = await self.filesystem.list_directory(".")
+            list_result = await self._cached_list(".", stat=False)
             if "error" in list_result:
                 return f"❌ Error listing files: {list_result['error']}"
             
             # Find image files
-            image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp']
-            image_files = []
-            
-            for item in list_result.get("items", []):
-                if item["type"] == "file":
-                    name_lower = item["name"].lower()
-                    if any(name_lower.endswith(ext) for ext in image_extensions):
-                        image_files.append(item["name"])
+            image_files = [
+                item["name"] for item in list_result.get("items", [])
+                if item["type"] == "file" and item["name"].lower().endswith(self.IMAGE_EXTS)
+            ]
             
             if not image_files:
                 return "❌ No image files found to delete."
             
-            # Delete each image file
-            for image_file in image_files:
-                delete_result = await self.filesystem.delete_file(image_file)
-                if "error" in delete_result:
-                    return f"❌ Error deleting {image_file}: {delete_result['error']}"
+            # Delete all image files in one batch
+            results = await self.filesystem.delete_files(image_files)
+            self._ls_cache.clear()
+            errors = self._collect_errors(image_files, results)
+            if errors:
+                deleted_count = len(image_files) - len(errors)
+                return f"❌ Deleted {deleted_count} image files, but some failed: " + \
+                       "; ".join(f"{name}: {error}" for name, error in errors)
             
             return f"✅ Successfully deleted {len(image_files)} image files."
         
@@ -494,7 +903,7 @@ class DesktopAgent:
         """Helper method to delete all files (but not directories) in the current folder."""
         try:
             logger.info("Attempting to delete all files in the current folder.")
-            list_result = await self.filesystem.list_directory(".")
+            list_result = await self._cached_list(".", stat=False)
             if "error" in list_result:
                 return f"❌ Error listing files to delete: {list_result['error']}"
 
@@ -503,14 +912,13 @@ class DesktopAgent:
             if not files_to_delete:
                 return "✅ No files found in the current folder to delete."
 
-            deleted_count = 0
-            errors = []
-            for file_name in files_to_delete:
-                delete_result = await self.filesystem.delete_file(file_name)
-                if "error" in delete_result:
-                    errors.append(f"❌ Error deleting {file_name}: {delete_result['error']}")
-                else:
-                    deleted_count += 1
+            results = await self.filesystem.delete_files(files_to_delete)
+            self._ls_cache.clear()
+            errors = [
+                f"❌ Error deleting {file_name}: {error}"
+                for file_name, error in self._collect_errors(files_to_delete, results)
+            ]
+            deleted_count = len(files_to_delete) - len(errors)
             
             if errors:
                 return f"✅ Deleted {deleted_count} files. Some errors occurred: {'; '.join(errors)}"
@@ -1,22 +1,51 @@
 import asyncio
+import codecs
+import errno
+import functools
 import json
 import logging
 import os
 import shutil
+import stat as stat_module
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from logging_config import configure_logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('mcp_filesystem.log'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging('mcp_filesystem.log')
 logger = logging.getLogger(__name__)
 
+# Path resolution and metadata caches; the agent probes the same few paths repeatedly
+RESOLVE_CACHE_SIZE = 1024
+STAT_CACHE_SIZE = 512
+STAT_CACHE_TTL_SECONDS = 1.0
+NEGATIVE_CACHE_TTL_SECONDS = 0.5
+
+# read_file decodes a small first read, then continues in large chunks
+READ_PEEK_SIZE = 4096
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Extensions read_file reports as binary without opening the file
+_BINARY_EXT = frozenset({
+    '.mp4', '.mov', '.avi', '.mkv',
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp',
+    '.pdf', '.zip', '.gz', '.exe', '.bin'
+})
+
+# write_file encodes and writes content this many characters at a time
+WRITE_CHUNK_SIZE = 64 * 1024
+
+# Entries per chunk yielded by iter_directory
+LIST_CHUNK_SIZE = 256
+
+# Directories scanned concurrently by list_directory_recursive
+RECURSIVE_LIST_WORKERS = 10
+
 class MCPFilesystemServer:
     def __init__(self, allowed_directory: str):
         self.allowed_directory = Path(allowed_directory).resolve()
@@ -25,32 +54,184 @@ class MCPFilesystemServer:
         # Ensure the directory exists
         if not self.allowed_directory.exists():
             raise ValueError(f"Directory does not exist: {self.allowed_directory}")
+        
+        # Bulk operations run in worker threads, so cache updates take a lock
+        self._cache_lock = threading.Lock()
+        self._stat_cache: "OrderedDict[Path, tuple]" = OrderedDict()  # path -> (expiry, stat_result)
+        self._negative_cache: Dict[Path, float] = {}  # missing path -> expiry
+        
+        # Containment is checked on normalized strings
+        self._allowed_str = str(self.allowed_directory)
+        self._allowed_prefix = os.path.join(self._allowed_str, "")
     
     def _is_path_allowed(self, path: str) -> bool:
         """Check if the path is within the allowed directory"""
         try:
-            resolved_path = Path(path).resolve()
-            return resolved_path.is_relative_to(self.allowed_directory)
+            normalized = os.path.normpath(path)
+            return normalized == self._allowed_str or normalized.startswith(self._allowed_prefix)
         except Exception as e:
             logger.error(f"Error checking path {path}: {e}")
             return False
     
     def _get_safe_path(self, path: str) -> Path:
         """Get a safe path within the allowed directory"""
-        if os.path.isabs(path):
-            safe_path = Path(path).resolve()
+        joined, normalized, components = self._normalize_path(self._allowed_str, path)
+        
+        # Without ".." or symlinks the normalized path is already the real one.
+        # Symlinks are checked on every call, since they can appear at any time
+        if components is not None and not any(os.path.islink(c) for c in components):
+            safe_path = Path(normalized)
         else:
-            safe_path = (self.allowed_directory / path).resolve()
+            safe_path = Path(joined).resolve()
         
         if not self._is_path_allowed(str(safe_path)):
             raise PermissionError(f"Access denied to path: {path}")
         
         return safe_path
     
-    async def list_directory(self, path: str = ".") -> Dict[str, Any]:
-        """List contents of a directory"""
+    @staticmethod
+    @functools.lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+    def _normalize_path(allowed_str: str, path: str) -> Tuple[str, str, Optional[Tuple[str, ...]]]:
+        """Join and normalize a path as strings only, without touching the filesystem
+        
+        Returns (joined, normalized, components), where components lists each path
+        below the allowed directory to check for symlinks, or is None when the path
+        has a ".." or lies outside the allowed directory and must be fully resolved.
+        """
+        joined = path if os.path.isabs(path) else os.path.join(allowed_str, path)
+        normalized = os.path.normpath(joined)
+        if ".." in Path(joined).parts:
+            return joined, normalized, None
+        if normalized == allowed_str:
+            return joined, normalized, ()
+        
+        prefix = os.path.join(allowed_str, "")
+        if not normalized.startswith(prefix):
+            return joined, normalized, None
+        
+        components = []
+        current = allowed_str
+        for name in normalized[len(prefix):].split(os.sep):
+            current = os.path.join(current, name)
+            components.append(current)
+        return joined, normalized, tuple(components)
+    
+    def _cached_stat(self, safe_path: Path) -> Optional[os.stat_result]:
+        """stat() a path through the positive and negative caches; None if it doesn't exist"""
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._stat_cache.get(safe_path)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            missing_until = self._negative_cache.get(safe_path)
+            if missing_until is not None and missing_until > now:
+                return None
+        
         try:
-            logger.debug(f"Listing directory: {path}")
+            st = safe_path.stat()
+        except FileNotFoundError:
+            with self._cache_lock:
+                self._negative_cache[safe_path] = now + NEGATIVE_CACHE_TTL_SECONDS
+            return None
+        
+        with self._cache_lock:
+            self._negative_cache.pop(safe_path, None)
+            self._stat_cache[safe_path] = (now + STAT_CACHE_TTL_SECONDS, st)
+            self._stat_cache.move_to_end(safe_path)
+            if len(self._stat_cache) > STAT_CACHE_SIZE:
+                self._stat_cache.popitem(last=False)
+        return st
+    
+    def _invalidate(self, safe_path: Path):
+        """Drop cached metadata for a path that was created, changed or removed"""
+        with self._cache_lock:
+            for affected in (safe_path, safe_path.parent):
+                self._stat_cache.pop(affected, None)
+            # Parent directories may have just been created as well
+            for affected in (safe_path, *safe_path.parents):
+                self._negative_cache.pop(affected, None)
+            # A removed or moved directory takes everything below it along
+            stale = [cached for cached in self._stat_cache if safe_path in cached.parents]
+            for cached in stale:
+                del self._stat_cache[cached]
+            # ...and a directory moved or created here can bring paths below it into existence
+            stale = [missing for missing in self._negative_cache if safe_path in missing.parents]
+            for missing in stale:
+                del self._negative_cache[missing]
+    
+    async def list_directory(self, path: str = ".", stat: bool = True) -> Dict[str, Any]:
+        """List contents of a directory; with stat=False, size and modified are left as None"""
+        try:
+            logger.debug("Listing directory: %s", path)
+            items = []
+            async for chunk in self.iter_directory(path, stat=stat):
+                items.extend(chunk)
+            
+            safe_path = self._get_safe_path(path)
+            result = {
+                "path": str(safe_path),
+                "items": items,
+                "count": len(items)
+            }
+            logger.info(f"Listed {len(items)} items in {safe_path}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error listing directory {path}: {e}")
+            return {"error": str(e)}
+    
+    async def iter_directory(self, path: str = ".", chunk: int = LIST_CHUNK_SIZE,
+                             stat: bool = True) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield directory items in chunks as they are scanned; raises on invalid paths"""
+        safe_path = self._get_safe_path(path)
+        
+        if not safe_path.exists():
+            raise FileNotFoundError(f"Directory does not exist: {path}")
+        
+        if not safe_path.is_dir():
+            raise NotADirectoryError(f"Path is not a directory: {path}")
+        
+        # Each chunk is read in a worker thread, and the loop gets a turn
+        # between chunks, so huge directories never stall other requests
+        entries = await asyncio.to_thread(os.scandir, safe_path)
+        try:
+            while True:
+                items = await asyncio.to_thread(self._scan_chunk, entries, chunk, stat)
+                if items:
+                    yield items
+                if len(items) < chunk:
+                    break
+                await asyncio.sleep(0)
+        finally:
+            entries.close()
+    
+    def _scan_chunk(self, entries, chunk: int, stat: bool) -> List[Dict[str, Any]]:
+        """Build listing items for up to chunk entries of an open scandir iterator"""
+        # Each DirEntry caches its type and stat result, so an entry
+        # costs at most one stat call (none with stat=False)
+        items = []
+        for entry in entries:
+            is_dir = entry.is_dir()
+            if stat:
+                st = entry.stat()
+                size = None if is_dir else st.st_size
+                modified = st.st_mtime
+            else:
+                size = modified = None
+            items.append({
+                "name": entry.name,
+                "type": "directory" if is_dir else "file",
+                "size": size,
+                "modified": modified
+            })
+            if len(items) >= chunk:
+                break
+        return items
+    
+    async def list_directory_recursive(self, path: str = ".") -> Dict[str, Any]:
+        """List all files under a directory, with paths relative to it"""
+        try:
+            logger.debug("Listing directory recursively: %s", path)
             safe_path = self._get_safe_path(path)
             
             if not safe_path.exists():
@@ -59,76 +240,135 @@ class MCPFilesystemServer:
             if not safe_path.is_dir():
                 return {"error": f"Path is not a directory: {path}"}
             
-            items = []
-            for item in safe_path.iterdir():
-                item_info = {
-                    "name": item.name,
-                    "type": "directory" if item.is_dir() else "file",
-                    "size": item.stat().st_size if item.is_file() else None,
-                    "modified": item.stat().st_mtime
-                }
-                items.append(item_info)
+            items = await asyncio.to_thread(self._list_recursive, safe_path)
             
             result = {
                 "path": str(safe_path),
                 "items": items,
                 "count": len(items)
             }
-            logger.info(f"Listed {len(items)} items in {safe_path}")
+            logger.info(f"Listed {len(items)} files under {safe_path}")
             return result
             
         except Exception as e:
-            logger.error(f"Error listing directory {path}: {e}")
+            logger.error(f"Error listing directory {path} recursively: {e}")
             return {"error": str(e)}
     
+    def _list_recursive(self, root: Path, max_workers: int = RECURSIVE_LIST_WORKERS) -> List[Dict[str, Any]]:
+        """Collect file items under root, scanning each level's directories in parallel"""
+        # scandir releases the GIL, so a level's directories are read concurrently;
+        # the pool size also caps how many directory fds are open at once
+        results = []
+        pending_dirs = [root]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending_dirs:
+                futures = [executor.submit(self._scan_tree_level, d) for d in pending_dirs]
+                pending_dirs = []
+                for future in as_completed(futures):
+                    files, subdirs = future.result()
+                    results.extend(
+                        {
+                            "name": os.path.relpath(entry_path, root),
+                            "type": "file",
+                            "size": st.st_size,
+                            "modified": st.st_mtime
+                        }
+                        for entry_path, st in files
+                    )
+                    pending_dirs.extend(subdirs)
+        return results
+    
+    def _scan_tree_level(self, directory) -> Tuple[List[tuple], List[str]]:
+        """Split one directory into (path, stat) for files and paths of subdirectories"""
+        files, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Symlinked directories are not followed, so the walk stays
+                    # inside the allowed directory and can't loop
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        files.append((entry.path, entry.stat()))
+        except OSError as e:
+            logger.warning(f"Skipping unreadable directory {directory}: {e}")
+        return files, subdirs
+    
     async def read_file(self, path: str) -> Dict[str, Any]:
         """Read contents of a file"""
         try:
-            logger.debug(f"Reading file: {path}")
+            logger.debug("Reading file: %s", path)
             safe_path = self._get_safe_path(path)
             
-            if not safe_path.exists():
-                return {"error": f"File does not exist: {path}"}
-            
-            if not safe_path.is_file():
-                return {"error": f"Path is not a file: {path}"}
-            
-            # Try to read as text first
-            try:
-                content = safe_path.read_text(encoding='utf-8')
-                result = {
-                    "path": str(safe_path),
-                    "content": content,
-                    "size": len(content),
-                    "type": "text"
-                }
-            except UnicodeDecodeError:
-                # If it's a binary file, read first 1024 bytes
-                content = safe_path.read_bytes()[:1024]
-                result = {
-                    "path": str(safe_path),
-                    "content": f"<Binary file, first 1024 bytes: {len(content)} bytes>",
-                    "size": safe_path.stat().st_size,
-                    "type": "binary"
-                }
-            
-            logger.info(f"Read file {safe_path} ({result['size']} bytes)")
+            # Checks and the read itself happen in one worker-thread hop
+            result = await asyncio.to_thread(self._read_file_sync, path, safe_path)
+            if "error" not in result:
+                logger.info(f"Read file {safe_path} ({result['size']} bytes)")
             return result
             
         except Exception as e:
             logger.error(f"Error reading file {path}: {e}")
             return {"error": str(e)}
     
+    def _read_file_sync(self, path: str, safe_path: Path) -> Dict[str, Any]:
+        """Read an already validated file"""
+        if not safe_path.exists():
+            return {"error": f"File does not exist: {path}"}
+        
+        if not safe_path.is_file():
+            return {"error": f"Path is not a file: {path}"}
+        
+        if safe_path.suffix.lower() in _BINARY_EXT:
+            return self._binary_result(safe_path, safe_path.stat().st_size)
+        
+        fd = os.open(safe_path, os.O_RDONLY)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            
+            # Decode incrementally as text; stop at the first invalid byte instead
+            # of decoding the whole file and then reading it again as bytes
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+            head = os.read(fd, READ_PEEK_SIZE)
+            # NUL bytes mark a binary file; skip decoding altogether
+            if b"\x00" in head:
+                return self._binary_result(safe_path, os.fstat(fd).st_size)
+            parts = []
+            try:
+                chunk = head
+                while chunk:
+                    parts.append(decoder.decode(chunk))
+                    chunk = os.read(fd, READ_CHUNK_SIZE)
+                parts.append(decoder.decode(b"", final=True))
+            except UnicodeDecodeError:
+                return self._binary_result(safe_path, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        
+        content = "".join(parts)
+        return {
+            "path": str(safe_path),
+            "content": content,
+            "size": len(content),
+            "type": "text"
+        }
+    
+    def _binary_result(self, safe_path: Path, size: int) -> Dict[str, Any]:
+        """Describe a binary file by the first 1024 bytes a preview would cover"""
+        return {
+            "path": str(safe_path),
+            "content": f"<Binary file, first 1024 bytes: {min(size, 1024)} bytes>",
+            "size": size,
+            "type": "binary"
+        }
+    
     async def write_file(self, path: str, content: str) -> Dict[str, Any]:
         """Write content to a file"""
         try:
-            logger.debug(f"Writing file: {path}")
+            logger.debug("Writing file: %s", path)
             safe_path = self._get_safe_path(path)
             
-            # Create parent directories if they don't exist
-            safe_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            safe_path.write_text(content, encoding='utf-8')
+            await asyncio.to_thread(self._write_file_sync, safe_path, content)
             
             result = {
                 "path": str(safe_path),
@@ -142,13 +382,38 @@ class MCPFilesystemServer:
             logger.error(f"Error writing file {path}: {e}")
             return {"error": str(e)}
     
+    def _write_file_sync(self, safe_path: Path, content: str):
+        """Create parent directories and write the file in a single worker-thread call"""
+        safe_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Encode a slice at a time so a large file never exists as one bytes copy
+        encoder = codecs.getincrementalencoder('utf-8')()
+        fd = os.open(safe_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            for start in range(0, len(content), WRITE_CHUNK_SIZE):
+                self._write_all(fd, encoder.encode(content[start:start + WRITE_CHUNK_SIZE]))
+            self._write_all(fd, encoder.encode("", final=True))
+            if hasattr(os, "posix_fadvise"):
+                # The agent rarely reads back what it writes; don't let it crowd the page cache
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+        self._invalidate(safe_path)
+    
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        """Write data to fd, continuing after short writes"""
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    
     async def create_directory(self, path: str) -> Dict[str, Any]:
         """Create a directory"""
         try:
-            logger.debug(f"Creating directory: {path}")
+            logger.debug("Creating directory: %s", path)
             safe_path = self._get_safe_path(path)
             
-            safe_path.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(self._create_directory_sync, safe_path)
             
             result = {
                 "path": str(safe_path),
@@ -161,76 +426,159 @@ class MCPFilesystemServer:
             logger.error(f"Error creating directory {path}: {e}")
             return {"error": str(e)}
     
+    def _create_directory_sync(self, safe_path: Path):
+        """Create a directory and any missing parents"""
+        safe_path.mkdir(parents=True, exist_ok=True)
+        self._invalidate(safe_path)
+    
     async def delete_file(self, path: str) -> Dict[str, Any]:
         """Delete a file or directory"""
         try:
-            logger.debug(f"Deleting: {path}")
+            logger.debug("Deleting: %s", path)
             safe_path = self._get_safe_path(path)
             
-            if not safe_path.exists():
-                return {"error": f"Path does not exist: {path}"}
-            
-            if safe_path.is_file():
-                safe_path.unlink()
-                message = "File deleted successfully"
-            elif safe_path.is_dir():
-                shutil.rmtree(safe_path)
-                message = "Directory deleted successfully"
-            else:
-                return {"error": f"Unknown path type: {path}"}
-            
-            result = {
-                "path": str(safe_path),
-                "message": message
-            }
-            logger.info(f"Deleted {safe_path}")
-            return result
+            return await asyncio.to_thread(self._delete_path, path, safe_path)
             
         except Exception as e:
             logger.error(f"Error deleting {path}: {e}")
             return {"error": str(e)}
     
+    def _delete_path(self, path: str, safe_path: Path) -> Dict[str, Any]:
+        """Delete an already validated path"""
+        if not safe_path.exists():
+            return {"error": f"Path does not exist: {path}"}
+        
+        if safe_path.is_file():
+            safe_path.unlink()
+            message = "File deleted successfully"
+        elif safe_path.is_dir():
+            self._fast_rmtree(safe_path)
+            message = "Directory deleted successfully"
+        else:
+            return {"error": f"Unknown path type: {path}"}
+        self._invalidate(safe_path)
+        
+        result = {
+            "path": str(safe_path),
+            "message": message
+        }
+        logger.info(f"Deleted {safe_path}")
+        return result
+    
+    @staticmethod
+    def _fast_rmtree(root):
+        """Delete a directory tree bottom-up, reusing each DirEntry's cached type"""
+        def read_entries(path):
+            # Read the whole directory before removing anything from it: readdir
+            # may skip entries once the directory changes under it (seen on macOS)
+            with os.scandir(path) as entries:
+                return iter(list(entries))
+        
+        # One pending entry list per level; symlinks are unlinked, never followed
+        stack = [(root, read_entries(root))]
+        while stack:
+            path, entries = stack[-1]
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, read_entries(entry.path)))
+                    break
+                os.unlink(entry.path)
+            else:
+                stack.pop()
+                os.rmdir(path)
+    
+    async def delete_files(self, paths: List[str]) -> List[Dict[str, Any]]:
+        """Delete several files or directories in one worker-thread pass"""
+        logger.debug("Deleting %s paths", len(paths))
+        return await asyncio.to_thread(self._delete_paths_sync, paths)
+    
+    def _delete_paths_sync(self, paths: List[str]) -> List[Dict[str, Any]]:
+        """Delete each path, collecting one result per path"""
+        results = []
+        for path in paths:
+            try:
+                results.append(self._delete_path(path, self._get_safe_path(path)))
+            except Exception as e:
+                logger.error(f"Error deleting {path}: {e}")
+                results.append({"error": str(e)})
+        return results
+    
     async def move_file(self, source: str, destination: str) -> Dict[str, Any]:
         """Move/rename a file or directory"""
         try:
-            logger.debug(f"Moving {source} to {destination}")
+            logger.debug("Moving %s to %s", source, destination)
             safe_source = self._get_safe_path(source)
             safe_dest = self._get_safe_path(destination)
             
-            if not safe_source.exists():
-                return {"error": f"Source does not exist: {source}"}
-            
-            # Create parent directory if it doesn't exist
-            safe_dest.parent.mkdir(parents=True, exist_ok=True)
-            
-            shutil.move(str(safe_source), str(safe_dest))
-            
-            result = {
-                "source": str(safe_source),
-                "destination": str(safe_dest),
-                "message": "File moved successfully"
-            }
-            logger.info(f"Moved {safe_source} to {safe_dest}")
-            return result
+            return await asyncio.to_thread(self._move_path, source, safe_source, safe_dest)
             
         except Exception as e:
             logger.error(f"Error moving {source} to {destination}: {e}")
             return {"error": str(e)}
     
+    def _move_path(self, source: str, safe_source: Path, safe_dest: Path) -> Dict[str, Any]:
+        """Move an already validated source path to an already validated destination"""
+        if not safe_source.exists():
+            return {"error": f"Source does not exist: {source}"}
+        
+        if safe_dest.is_dir():
+            # Moving into an existing directory keeps shutil.move's semantics
+            shutil.move(str(safe_source), str(safe_dest))
+        else:
+            # Create parent directory if it doesn't exist; a plain rename already has one
+            if safe_dest.parent != safe_source.parent:
+                safe_dest.parent.mkdir(parents=True, exist_ok=True)
+            
+            # Same-filesystem moves are a single rename; only cross-device ones copy
+            try:
+                os.rename(safe_source, safe_dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(str(safe_source), str(safe_dest))
+        self._invalidate(safe_source)
+        self._invalidate(safe_dest)
+        
+        result = {
+            "source": str(safe_source),
+            "destination": str(safe_dest),
+            "message": "File moved successfully"
+        }
+        logger.info(f"Moved {safe_source} to {safe_dest}")
+        return result
+    
+    async def move_files(self, moves: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Move several (source, destination) pairs in one worker-thread pass"""
+        logger.debug("Moving %s paths", len(moves))
+        return await asyncio.to_thread(self._move_paths_sync, moves)
+    
+    def _move_paths_sync(self, moves: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Move each pair, collecting one result per pair"""
+        results = []
+        for source, destination in moves:
+            try:
+                safe_source = self._get_safe_path(source)
+                safe_dest = self._get_safe_path(destination)
+                results.append(self._move_path(source, safe_source, safe_dest))
+            except Exception as e:
+                logger.error(f"Error moving {source} to {destination}: {e}")
+                results.append({"error": str(e)})
+        return results
+    
     async def get_file_info(self, path: str) -> Dict[str, Any]:
         """Get information about a file or directory"""
         try:
-            logger.debug(f"Getting info for: {path}")
+            logger.debug("Getting info for: %s", path)
             safe_path = self._get_safe_path(path)
             
-            if not safe_path.exists():
+            stat = self._cached_stat(safe_path)
+            if stat is None:
                 return {"error": f"Path does not exist: {path}"}
             
-            stat = safe_path.stat()
             result = {
                 "path": str(safe_path),
                 "name": safe_path.name,
-                "type": "directory" if safe_path.is_dir() else "file",
+                "type": "directory" if stat_module.S_ISDIR(stat.st_mode) else "file",
                 "size": stat.st_size,
                 "created": stat.st_ctime,
                 "modified": stat.st_mtime,
@@ -0,0 +1,34 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def configure_logging(log_file: str, level: int = logging.INFO):
+    """Configure root logging with file and console output written from a background thread"""
+    root = logging.getLogger()
+    if root.handlers:
+        # Like logging.basicConfig, the first module to configure logging wins
+        return None
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    
+    # Callers only enqueue records; the listener thread does the formatting and disk I/O
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    
+    # QueueHandler merges args into the message before enqueueing; keep that
+    # to the bare message so the listener's formatter isn't applied twice
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=level, handlers=[queue_handler])
+    return listener
@@ -1,28 +1,12 @@
 import asyncio
 import logging
 from desktop_agent import DesktopAgent
+from logging_config import configure_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, # Keep this at INFO to ensure file logging captures INFO messages
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('main.log'), # Add a file handler for main.py logs
-        logging.StreamHandler() # This is the console handler
-    ]
-)
+# Configure logging; the console handler already shows INFO action messages
+configure_logging('main.log')
 logger = logging.getLogger(__name__)
 
-# Set the console handler's level to WARNING or ERROR
-for handler in logging.getLogger().handlers:
-    if isinstance(handler, logging.StreamHandler):
-        handler.setLevel(logging.WARNING) # Changed to WARNING to suppress INFO messages 
-
-# Set the console handler's level back to INFO to show actions
-for handler in logging.getLogger().handlers:
-    if isinstance(handler, logging.StreamHandler):
-        handler.setLevel(logging.INFO) # Set to INFO to show action messages
-
 async def main():
     """Main function to run the desktop agent"""
     print("🤖 Desktop Agent Starting...")
@@ -74,10 +58,20 @@ async def main():
             except Exception as e:
                 logger.error(f"Error in main loop: {e}")
                 print(f"❌ Error: {e}")
+        
+        await agent.close()
     
     except Exception as e:
         logger.error(f"Failed to initialize agent: {e}")
         print(f"❌ Failed to start agent: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # uvloop is an optional, faster drop-in event loop
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    if uvloop is not None and hasattr(uvloop, "run"):
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -1,41 +1,111 @@
-import requests
+import asyncio
+import functools
+import httpx
 import json
 import logging
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Chunks read past the end of the reply object while waiting for the final one
+STREAM_TRAILING_CHUNKS = 8
+
+# Usage rules sent ahead of the tool list in every system prompt
+_SYSTEM_PROMPT = """You are a desktop file management assistant. You work exclusively in the /Users/shakib/Desktop/TestFolder directory.
+
+IMPORTANT RULES:
+1. When users ask to list files/folders, or "list everything", use: {"tool": "list_directory", "args": {"path": "."}} The `desktop_agent` will then filter the results based on the user's specific request (e.g., "list all files", "list folders").
+2. When users ask about specific file types (like .mp4, .jpg, .png), first list the directory ({"tool": "list_directory", "args": {"path": "."}}) then rely on the agent's internal filtering.
+3. Always use relative paths from the Desktop directory (e.g., "my_file.txt", "my_folder/another_file.doc"). DO NOT include "/Users/shakib/Desktop/TestFolder" in the path you provide to tools.
+4. Always reply with a single JSON object and nothing else. For tool calls, use EXACTLY this format: {"tool": "tool_name", "args": {"argument_name": "value"}}, where the argument names are the ones shown in each tool's usage. When no tool is needed, reply with {"response": "your answer"}.
+5. When asked to create a new file or application (like a calculator or a game), use the `write_file` tool and directly provide the *complete, runnable code* as the content argument.
+6. When writing code, choose an appropriate file extension (e.g., .py for Python, .js for JavaScript, .html for HTML). For Python code, ensure it's self-contained and runnable.
+7. If the user asks to "rename" a file or folder, or "move" a file/folder to a new location, always use the `move_file(source, destination)` tool directly. For example, "rename folder A to B" should result in `{"tool": "move_file", "args": {"source": "A", "destination": "B"}}`. For existing items, make sure to specify the current full item name as `source` and the new name as `destination`.
+8. When the user explicitly asks to "delete" a specific file (e.g., "delete cal.txt"), use the `delete_file(path)` tool directly. Do NOT list the directory first. Example: `{"tool": "delete_file", "args": {"path": "cal.txt"}}`.
+9. If the user asks "what can you do?" or "what are your capabilities?", summarize the available tools and their purposes concisely in a {"response": ...} reply.
+10. Be direct, helpful, and provide the most relevant action immediately. Avoid unnecessary steps or confirmations if the command is clear.
+
+"""
+
+# Legacy text tool-call format, TOOL_CALL:name(args), for models that ignore JSON mode
+_TOOL_CALL_RE = re.compile(r'(?:TOOL_CALL|USE_TOOL):\s*(\w+)\s*\((.*?)\)', re.DOTALL)
+
+def parse_tool_call(text: str) -> Optional[Tuple[str, str]]:
+    """Find the first TOOL_CALL:name(args) in text; returns (name, args) or None"""
+    match = _TOOL_CALL_RE.search(text)
+    return (match.group(1), match.group(2).strip()) if match else None
+
+# Speaker labels used when formatting conversation history; other roles are skipped
+_ROLE_PREFIX = {"user": "User: ", "assistant": "Assistant: ", "system": "System: "}
+
+@functools.lru_cache(maxsize=4)
+def _format_tools(tools_key: tuple) -> str:
+    """Format the tool list section from (name, description) pairs"""
+    return "Available tools:\n" + "\n".join(
+        f"- {name}: {description}" for name, description in tools_key
+    ) + "\n\n"
+
+class _ObjectEndScanner:
+    """Track brace depth over streamed text to spot the end of the top-level JSON object"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str) -> bool:
+        """Consume text; return True once the first top-level object has closed"""
+        for ch in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
 class OllamaClient:
     def __init__(self, base_url: str = "http://localhost:11434", model: str = "thirdeyeai/qwen2.5-1.5b-instruct-uncensored:latest"): # Updated model here
         self.base_url = base_url
         self.model = model
+        # One pooled keep-alive client for the lifetime of the process
+        self._session = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60),
+            timeout=60 # Increased timeout
+        )
+        # Token context returned by the last completed generation, together with
+        # the system prompt and the messages it covers: the prompt it was generated
+        # from followed by the assistant reply it ends in
+        self._context: Optional[List[int]] = None
+        self._context_system: Optional[str] = None
+        self._context_messages: List[Dict[str, str]] = []
+        # Whether the last covered message is still the raw reply, awaiting record_reply
+        self._context_reply_pending = False
         logger.info(f"Initialized Ollama client with model: {model}")
     
-    async def generate_response(self, messages: List[Dict[str, str]], tools: List[Dict] = None) -> str:
+    async def generate_response(self, messages: List[Dict[str, str]], tools: List[Dict] = None, system: str = None,
+                                use_context: bool = True) -> str:
         """Generate response from Ollama"""
         try:
             logger.debug(f"Generating response with {len(messages)} messages")
             
-            # Prepare the prompt with better context
-            prompt = self._format_messages_with_context(messages, tools)
-            
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,  # Lower temperature for more consistent tool calls
-                    "top_p": 0.9,
-                    "num_predict": 2000  # Increased response length for code generation
-                }
-            }
+            payload = self._build_payload(messages, tools, system, stream=True, use_context=use_context)
             
             logger.debug(f"Sending request to Ollama")
-            response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=60) # Increased timeout
-            response.raise_for_status()
-            
-            result = response.json()
-            generated_text = result.get("response", "").strip()
+            generated_text = "".join([
+                text async for text in self._stream_text(payload, messages if use_context else None)
+            ]).strip()
             
             logger.info(f"Generated response: {len(generated_text)} characters")
             return generated_text
@@ -44,40 +114,174 @@ class OllamaClient:
             logger.error(f"Error generating response: {e}")
             return f"Error communicating with Ollama: {str(e)}"
     
-    def _format_messages_with_context(self, messages: List[Dict[str, str]], tools: List[Dict] = None) -> str:
-        """Format messages with better context for tool usage"""
-        prompt = """You are a desktop file management assistant. You work exclusively in the /Users/shakib/Desktop/TestFolder directory.
-
-IMPORTANT RULES:
-1. When users ask to list files/folders, or "list everything", use: TOOL_CALL:list_directory(.) The `desktop_agent` will then filter the results based on the user's specific request (e.g., "list all files", "list folders").
-2. When users ask about specific file types (like .mp4, .jpg, .png), first list the directory (TOOL_CALL:list_directory(.)) then rely on the agent's internal filtering.
-3. Always use relative paths from the Desktop directory (e.g., "my_file.txt", "my_folder/another_file.doc"). DO NOT include "/Users/shakib/Desktop/TestFolder" in the path you provide to tools.
-4. For tool calls, use EXACTLY this format: TOOL_CALL:tool_name(arguments). Ensure arguments are properly quoted if they contain spaces or special characters.
-5. When asked to create a new file or application (like a calculator or a game), use the `write_file` tool and directly provide the *complete, runnable code* as the content argument.
-6. When writing code, choose an appropriate file extension (e.g., .py for Python, .js for JavaScript, .html for HTML). For Python code, ensure it's self-contained and runnable.
-7. If the user asks to "rename" a file or folder, or "move" a file/folder to a new location, always use the `move_file(source, destination)` tool directly. For example, "rename folder A to B" should result in `TOOL_CALL:move_file('A', 'B')`. For existing items, make sure to specify the current full item name as `source` and the new name as `destination`.
-8. When the user explicitly asks to "delete" a specific file (e.g., "delete cal.txt"), use the `delete_file(path)` tool directly. Do NOT list the directory first. Example: `TOOL_CALL:delete_file('cal.txt')`.
-9. If the user asks "what can you do?" or "what are your capabilities?", summarize the available tools and their purposes concisely.
-10. Be direct, helpful, and provide the most relevant action immediately. Avoid unnecessary steps or confirmations if the command is clear.
-
-"""
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: List[Dict] = None, system: str = None) -> AsyncIterator[str]:
+        """Generate a response from Ollama, yielding text chunks as they are decoded"""
+        generated_chars = 0
+        try:
+            logger.debug(f"Streaming response with {len(messages)} messages")
+            
+            payload = self._build_payload(messages, tools, system, stream=True, use_context=True)
+            
+            async for text in self._stream_text(payload, messages):
+                generated_chars += len(text)
+                yield text
+            
+            logger.info(f"Streamed response: {generated_chars} characters")
+            
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            if generated_chars:
+                # Part of a reply already went out; appending the message to it
+                # would pass for reply text, so let the caller handle the failure
+                raise
+            yield f"Error communicating with Ollama: {str(e)}"
+    
+    async def _stream_text(self, payload: Dict[str, Any],
+                           messages: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """Yield response text from /api/generate, stopping once the reply object is complete"""
+        scanner = _ObjectEndScanner()
+        closed = False
+        trailing = 0
+        reply_parts = []
+        async with self._session.stream("POST", "/api/generate", json=payload) as response:
+            response.raise_for_status()
+            # Ollama streams one JSON object per line
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                # Failures after the 200 status arrive as an {"error": ...} line
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                text = chunk.get("response", "")
+                reply_parts.append(text)
+                if closed:
+                    # Replies are a single JSON object; once it closes, anything
+                    # further is padding. Wait a few chunks for the final one, which
+                    # carries the context, then drop the connection to stop decoding
+                    trailing += 1
+                    if trailing > STREAM_TRAILING_CHUNKS and not chunk.get("done"):
+                        break
+                elif text:
+                    yield text
+                    closed = scanner.feed(text)
+                if chunk.get("done"):
+                    # Remember the context so the next turn only sends new messages.
+                    # It ends in the raw reply, so it only applies to a history
+                    # that records exactly that text as the next assistant message
+                    if messages is not None and chunk.get("context"):
+                        self._context = chunk["context"]
+                        self._context_system = payload.get("system", self._context_system)
+                        self._context_messages = list(messages) + [
+                            {"role": "assistant", "content": "".join(reply_parts).strip()}
+                        ]
+                        self._context_reply_pending = True
+                    break
+    
+    def _build_payload(self, messages: List[Dict[str, str]], tools: List[Dict], system: str, stream: bool,
+                       use_context: bool = False) -> Dict[str, Any]:
+        """Build the /api/generate request body"""
+        # Static rules and tools go in the system field so they form a fixed
+        # prefix Ollama can reuse from its KV cache; only the conversation varies
+        if system is None:
+            system = self.build_system_prompt(tools)
         
-        if tools:
-            prompt += "Available tools:\\n"
-            for tool in tools:
-                prompt += f"- {tool['name']}: {tool['description']}\\n"
-            prompt += "\\n"
+        # If the last context covers the start of this conversation, send it back
+        # and only format what came after, so Ollama skips re-evaluating the rest
+        context = None
+        covered = len(self._context_messages)
+        if (use_context and self._context and system == self._context_system
+                and covered < len(messages) and messages[:covered] == self._context_messages):
+            context = self._context
+            messages = messages[covered:]
+        
+        payload = {
+            "model": self.model,
+            "system": system,
+            "prompt": self._format_messages_with_context(messages),
+            "stream": stream,
+            # Constrain decoding to valid JSON so tool calls always parse
+            "format": "json",
+            "options": {
+                "temperature": 0.3,  # Lower temperature for more consistent tool calls
+                "top_p": 0.9,
+                "num_predict": 2000  # Increased response length for code generation
+            }
+        }
+        if context is not None:
+            # The context already holds the templated system prompt; sending it
+            # again would have Ollama template another copy behind it
+            payload["context"] = context
+            del payload["system"]
+        return payload
+    
+    async def generate_batch(self, message_lists: List[List[Dict[str, str]]], tools: List[Dict] = None, system: str = None) -> List[str]:
+        """Generate responses for several conversations at once"""
+        # Ollama serves concurrent requests in parallel, sharing the loaded model;
+        # concurrent prompts would race on the shared context, so only a lone one uses it
+        use_context = len(message_lists) == 1
+        return await asyncio.gather(*(
+            self.generate_response(messages, tools, system=system, use_context=use_context)
+            for messages in message_lists
+        ))
+    
+    def record_reply(self, raw: str, recorded: str):
+        """Note the assistant text the caller recorded for the last raw reply
         
-        # Add conversation history
+        The context holds the reply as generated, e.g. {"response": "Hi"}, while the
+        history keeps its decoded text; once told that text, the next turn's history
+        matches the context and only the new messages need to be sent.
+        """
+        if (self._context_reply_pending
+                and self._context_messages[-1]["content"] == raw.strip()):
+            self._context_messages[-1] = {"role": "assistant", "content": recorded}
+        self._context_reply_pending = False
+    
+    def reset_context(self):
+        """Forget the stored generation context"""
+        self._context = None
+        self._context_system = None
+        self._context_messages = []
+        self._context_reply_pending = False
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self._session.aclose()
+    
+    async def warm_up(self, system: str) -> bool:
+        """Send the system prompt once so Ollama loads the model and caches its prefix"""
+        try:
+            payload = {
+                "model": self.model,
+                "system": system,
+                "prompt": self._format_messages_with_context([]),
+                "stream": False,
+                "options": {
+                    "num_predict": 1
+                }
+            }
+            response = await self._session.post("/api/generate", json=payload)
+            response.raise_for_status()
+            logger.info("Ollama warm-up completed")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Ollama warm-up failed: {e}")
+            return False
+    
+    def build_system_prompt(self, tools: List[Dict] = None) -> str:
+        """Build the static system prompt: usage rules followed by the tool list"""
+        if not tools:
+            return _SYSTEM_PROMPT
+        return _SYSTEM_PROMPT + _format_tools(tuple((tool['name'], tool['description']) for tool in tools))
+    
+    def _format_messages_with_context(self, messages: List[Dict[str, str]]) -> str:
+        """Format the conversation history that follows the system prompt"""
+        parts = []
         for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if role == "user":
-                prompt += f"User: {content}\\n"
-            elif role == "assistant":
-                prompt += f"Assistant: {content}\\n"
-            elif role == "system":
-                prompt += f"System: {content}\\n"
+            prefix = _ROLE_PREFIX.get(msg.get("role", "user"))
+            if prefix:
+                parts.append(f"{prefix}{msg.get('content', '')}\n")
         
-        prompt += "Assistant: "
-        return prompt
+        parts.append("Assistant: ")
+        return "".join(parts)